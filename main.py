@@ -7,28 +7,103 @@ Economic News Service v4.3.0 - Playwright Edition
 """
 
 import asyncio
+import copy
 import json
 import logging
+import logging.handlers
+import os
 import re
+import time
 import httpx
 from datetime import datetime, timezone, timedelta
 from typing import Optional
-from collections import deque
+from collections import deque, OrderedDict
 from contextlib import asynccontextmanager
+from queue import SimpleQueue
 from urllib.parse import quote
 
 from fastapi import FastAPI, Request
 from fastapi.responses import StreamingResponse, JSONResponse
 from playwright.async_api import async_playwright, Page
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        logging.FileHandler('/tmp/economic_news.log'),
-        logging.StreamHandler()
-    ]
-)
+LOG_FILE = '/tmp/economic_news.log'
+LOG_MAX_BYTES = 10 * 1024 * 1024  # 单个日志文件上限，超出后轮转
+LOG_BACKUP_COUNT = 5
+LOG_JSON = False  # True 则输出 JSON 行日志
+# 后台运行时设 ECONOMIC_NEWS_LOG_CONSOLE=0，只写轮转的 LOG_FILE，不再输出到 stderr
+LOG_CONSOLE = os.environ.get('ECONOMIC_NEWS_LOG_CONSOLE', '1') != '0'
+POLL_ERROR_LOG_INTERVAL = 60  # 相同 Poll error 最多每 60 秒记录一次
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """入队时只展开 msg % args，保留 exc_info，交给监听线程的 formatter 处理"""
+
+    def __init__(self, log_queue: SimpleQueue, listener: logging.handlers.QueueListener):
+        super().__init__(log_queue)
+        self.listener = listener
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """日志经队列交给后台线程写入，事件循环内的 logger 调用不做磁盘 IO"""
+    root = logging.getLogger()
+    for handler in root.handlers:
+        # 重复调用时复用已有的队列和监听线程
+        if isinstance(handler, LogQueueHandler):
+            return handler.listener
+    
+    if LOG_JSON:
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
+    
+    file_handler = logging.handlers.RotatingFileHandler(
+        LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+    )
+    handlers = [file_handler]
+    if LOG_CONSOLE:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    
+    log_queue = SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    root.setLevel(logging.INFO)
+    root.addHandler(LogQueueHandler(log_queue, listener))
+    return listener
+
+log_listener = setup_logging()
+log_listener_running = False
+
+def start_log_listener():
+    global log_listener_running
+    if not log_listener_running:
+        log_listener.start()
+        log_listener_running = True
+
+def stop_log_listener():
+    """停止监听线程并写完队列中剩余日志，可重复调用"""
+    global log_listener_running
+    if log_listener_running:
+        log_listener.stop()
+        log_listener_running = False
+
+start_log_listener()
 logger = logging.getLogger(__name__)
 
 VERSION = "4.3.0"
@@ -43,11 +118,147 @@ class State:
     classify_list: list = []
     trading_clock: dict = {}
     sse_clients: set = set()
+    burst_clients: set = set()  # 订阅 burst 事件的 SSE 客户端
     connected: bool = False
     last_update: Optional[datetime] = None
 
 state = State()
 
+JIN10_TZ = timezone(timedelta(hours=8))  # 快讯 time 字段为北京时间
+STATS_WINDOW_MINUTES = 24 * 60
+STATS_WINDOWS = (60, STATS_WINDOW_MINUTES)  # /stats 提供的窗口：1h、24h
+STATS_SEEN_MAX = 5000  # 已计数快讯 ID 上限，防止 flash_list 淘汰后重复计数
+BURST_MIN_COUNT = 5  # 当前分钟至少多少条才算 burst
+BURST_FACTOR = 3.0   # 当前分钟条数 >= 过去 1 小时平均每分钟条数 * BURST_FACTOR
+
+class MinuteRing:
+    """按分钟分桶的环形计数器，并维护各窗口的滚动合计，写入和读取均摊 O(1)"""
+
+    def __init__(self, size: int = STATS_WINDOW_MINUTES, windows: tuple = STATS_WINDOWS):
+        self.size = size
+        self.counts = [0] * size
+        self.minutes = [-1] * size  # 每个桶当前对应的 epoch 分钟
+        self.head = -1  # 已推进到的最新分钟
+        self.sums = {w: 0 for w in windows}  # 窗口 (head - w, head] 内的合计
+
+    def advance(self, now_minute: int):
+        """推进 head，把滑出各窗口的桶从合计中减去"""
+        if now_minute <= self.head:
+            return
+        if self.head < 0 or now_minute - self.head >= self.size:
+            # 所有桶都已滑出窗口
+            self.sums = {w: 0 for w in self.sums}
+        else:
+            for m in range(self.head + 1, now_minute + 1):
+                for w in self.sums:
+                    leaving = m - w
+                    idx = leaving % self.size
+                    if self.minutes[idx] == leaving:
+                        self.sums[w] -= self.counts[idx]
+        self.head = now_minute
+
+    def add(self, minute: int, n: int = 1):
+        self.advance(minute)
+        idx = minute % self.size
+        if self.minutes[idx] == minute:
+            self.counts[idx] += n
+        elif self.minutes[idx] < minute:
+            # 桶已过期（其计数已在 advance 中减去），复用
+            self.minutes[idx] = minute
+            self.counts[idx] = n
+        else:
+            # minutes[idx] > minute: 超出窗口的旧数据，忽略
+            return
+        for w in self.sums:
+            if minute > self.head - w:
+                self.sums[w] += n
+
+    def get(self, minute: int) -> int:
+        idx = minute % self.size
+        return self.counts[idx] if self.minutes[idx] == minute else 0
+
+    def total(self, now_minute: int, window: int) -> int:
+        """窗口 (now_minute - window, now_minute] 内的合计，window 须在 STATS_WINDOWS 中"""
+        self.advance(now_minute)
+        return self.sums[window]
+
+class FlashStats:
+    """快讯流量统计：总量 / 重要程度 / 分类 三类通道，各自维护 24h 分钟环"""
+
+    def __init__(self):
+        self.all = MinuteRing()
+        self.importance = {'important': MinuteRing(), 'normal': MinuteRing()}
+        self.channels: dict = {}  # channel_id -> MinuteRing
+        self.seen: OrderedDict = OrderedDict()  # 已计数的快讯 ID
+        self.first_minute = -1  # 最早计数的快讯所在分钟，此前没有数据
+        self.last_burst_minute = -1
+
+    def record(self, flash_id: str, minute: int, important: bool, channels: list) -> bool:
+        """记录一条快讯，已计数过的 ID 返回 False"""
+        if flash_id:
+            if flash_id in self.seen:
+                return False
+            self.seen[flash_id] = None
+            if len(self.seen) > STATS_SEEN_MAX:
+                self.seen.popitem(last=False)
+        if self.first_minute < 0 or minute < self.first_minute:
+            self.first_minute = minute
+        self.all.add(minute)
+        self.importance['important' if important else 'normal'].add(minute)
+        for cid in channels:
+            ring = self.channels.get(cid)
+            if ring is None:
+                ring = self.channels[cid] = MinuteRing()
+            ring.add(minute)
+        return True
+
+    def coverage(self, now_minute: int, window: int) -> int:
+        """窗口内实际有统计数据的分钟数（服务启动不足一个窗口时小于 window）"""
+        if self.first_minute < 0:
+            return 0
+        return max(0, min(window, now_minute - self.first_minute + 1))
+
+    def check_burst(self, now_minute: int) -> Optional[dict]:
+        """当前分钟快讯数突破阈值时返回 burst 信息，每分钟最多触发一次"""
+        if self.last_burst_minute == now_minute:
+            return None
+        count = self.all.get(now_minute)
+        # 基线取当前分钟之前的 1 小时
+        baseline = (self.all.total(now_minute, 60) + self.all.get(now_minute - 60) - count) / 60
+        threshold = max(BURST_MIN_COUNT, baseline * BURST_FACTOR)
+        if count < threshold:
+            return None
+        self.last_burst_minute = now_minute
+        return {
+            'minute': minute_to_iso(now_minute),
+            'count': count,
+            'baseline_per_minute': round(baseline, 2),
+            'threshold': round(threshold, 2),
+        }
+
+flash_stats = FlashStats()
+
+def current_minute() -> int:
+    return int(datetime.now(timezone.utc).timestamp()) // 60
+
+def minute_to_iso(minute: int) -> str:
+    return datetime.fromtimestamp(minute * 60, JIN10_TZ).isoformat()
+
+def flash_minute(flash: dict) -> int:
+    """快讯发布时间所在的 epoch 分钟，解析失败则用当前时间"""
+    try:
+        dt = datetime.strptime(flash.get('time', ''), '%Y-%m-%d %H:%M:%S').replace(tzinfo=JIN10_TZ)
+        return min(int(dt.timestamp()) // 60, current_minute())
+    except (TypeError, ValueError):
+        return current_minute()
+
+def record_flash_stats(raw: dict, parsed: dict):
+    """用原始快讯的 channel 和解析后的 important 更新统计"""
+    channels = raw.get('channel') or []
+    if not isinstance(channels, list):
+        channels = []
+    flash_stats.record(parsed['_id'], flash_minute(parsed), parsed['important'], channels)
+
 def extract_title(content: str) -> str:
     if not content:
         return ""
@@ -115,17 +326,20 @@ def parse_flash_for_search(flash: dict) -> Optional[dict]:
         'content': content,
     }
 
-async def broadcast_sse(event_type: str, data: dict):
-    if not state.sse_clients:
+async def broadcast_sse(event_type: str, data: dict, clients: Optional[set] = None):
+    if clients is None:
+        clients = state.sse_clients
+    if not clients:
         return
     message = f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
     dead_clients = set()
-    for queue in state.sse_clients:
+    for client in clients:
         try:
-            await queue.put(message)
+            await client.put(message)
         except:
-            dead_clients.add(queue)
+            dead_clients.add(client)
     state.sse_clients -= dead_clients
+    state.burst_clients -= dead_clients
 
 def get_market_status(market: dict) -> dict:
     name = market.get('name', '')
@@ -254,6 +468,10 @@ GET_DATA_JS = """
 """
 
 async def poll_data():
+    error_count = 0       # 连续失败次数
+    suppressed = 0        # 自上次记录以来被抑制的相同 Poll error 数
+    last_error = None     # 上次记录的 (异常类型, 信息)
+    last_error_log = 0.0
     while True:
         await asyncio.sleep(3)
         if not state.page or not state.connected:
@@ -295,14 +513,43 @@ async def poll_data():
                         parsed = parse_flash(flash, filter_vip=True)
                         if parsed:  # 非 VIP 快讯
                             state.flash_list.appendleft(parsed)
+                            record_flash_stats(flash, parsed)
                             new_count += 1
                             await broadcast_sse('flash', parsed)
                 
                 if new_count > 0:
                     logger.info(f"Added {new_count} new flash items (VIP filtered)")
+                    burst = flash_stats.check_burst(current_minute())
+                    if burst:
+                        logger.info(f"Flash burst: {burst['count']} items in current minute")
+                        await broadcast_sse('burst', burst, state.burst_clients)
+            
+            if error_count:
+                logger.info(f"Poll recovered after {error_count} errors")
+                error_count = suppressed = 0
+                last_error = None
                     
         except Exception as e:
-            logger.warning(f"Poll error: {e}")
+            error_count += 1
+            error_key = (type(e), str(e))
+            now = time.monotonic()
+            if error_key != last_error:
+                # 新的错误立即记录，之前被抑制的次数一并带出
+                if suppressed:
+                    logger.warning(f"Poll error: {last_error[1]} (suppressed {suppressed} repeats)")
+                logger.warning(f"Poll error: {e}")
+                last_error = error_key
+                last_error_log = now
+                suppressed = 0
+            elif now - last_error_log >= POLL_ERROR_LOG_INTERVAL:
+                if suppressed:
+                    logger.warning(f"Poll error: {e} (suppressed {suppressed} repeats)")
+                else:
+                    logger.warning(f"Poll error: {e}")
+                last_error_log = now
+                suppressed = 0
+            else:
+                suppressed += 1
 
 async def start_browser():
     logger.info("Starting Playwright browser...")
@@ -341,6 +588,7 @@ async def start_browser():
             parsed = parse_flash(flash, filter_vip=True)
             if parsed:
                 state.flash_list.appendleft(parsed)
+                record_flash_stats(flash, parsed)
             else:
                 vip_count += 1
         logger.info(f"Initial Flash: {len(state.flash_list)} items (filtered {vip_count} VIP)")
@@ -357,15 +605,19 @@ async def start_browser():
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    start_log_listener()
     logger.info(f"Economic News Service v{VERSION} starting...")
     asyncio.create_task(start_browser())
     asyncio.create_task(poll_data())
     yield
-    if state.browser:
-        await state.browser.close()
-    if state.playwright:
-        await state.playwright.stop()
-    logger.info("Service stopped")
+    try:
+        if state.browser:
+            await state.browser.close()
+        if state.playwright:
+            await state.playwright.stop()
+        logger.info("Service stopped")
+    finally:
+        stop_log_listener()
 
 app = FastAPI(title="Economic News", version=VERSION, lifespan=lifespan)
 
@@ -383,16 +635,19 @@ async def index():
     }
 
 @app.get("/events")
-async def sse_events(request: Request, history: bool = True):
+async def sse_events(request: Request, history: bool = True, burst: bool = False):
     """
     SSE 实时订阅
     
     Args:
         history: 是否推送历史消息，默认 True。设为 False 则只推送连接后的新消息
+        burst: 是否推送 burst 事件（快讯流量突增），默认 False
     """
     async def event_generator():
         queue = asyncio.Queue()
         state.sse_clients.add(queue)
+        if burst:
+            state.burst_clients.add(queue)
         try:
             if history:
                 if state.top_list:
@@ -409,6 +664,7 @@ async def sse_events(request: Request, history: bool = True):
                     yield ": keepalive\n\n"
         finally:
             state.sse_clients.discard(queue)
+            state.burst_clients.discard(queue)
     
     return StreamingResponse(
         event_generator(),
@@ -464,6 +720,15 @@ def clean_category(cat):
         result['child'] = [{'id': c.get('id'), 'name': c.get('name')} for c in cat.get('child', [])]
     return result
 
+def find_category_name(category_id: int) -> Optional[str]:
+    for cat in state.classify_list:
+        if cat.get('id') == category_id:
+            return cat.get('name')
+        for child in cat.get('child', []):
+            if child.get('id') == category_id:
+                return child.get('name')
+    return None
+
 @app.get("/categories")
 async def get_categories():
     cleaned = [clean_category(c) for c in state.classify_list]
@@ -478,15 +743,7 @@ async def get_by_category(category_id: int, limit: int = 50):
     limit = min(limit, 200)
     items = [f for f in state.flash_list if category_id in f.get('channel', [])]
     
-    category_name = None
-    for cat in state.classify_list:
-        if cat.get('id') == category_id:
-            category_name = cat.get('name')
-            break
-        for child in cat.get('child', []):
-            if child.get('id') == category_id:
-                category_name = child.get('name')
-                break
+    category_name = find_category_name(category_id)
     
     clean_items = [{k:v for k,v in f.items() if k != '_id'} for f in items[:limit]]
     return JSONResponse({
@@ -497,6 +754,52 @@ async def get_by_category(category_id: int, limit: int = 50):
         "items": clean_items,
     })
 
+@app.get("/stats")
+async def get_stats():
+    """快讯流量统计（1h / 24h），只读计数器，不遍历快讯列表"""
+    now_minute = current_minute()
+    
+    windows = {}
+    for name, minutes in zip(('1h', '24h'), STATS_WINDOWS):
+        # 按实际覆盖的分钟数计算速率，避免重启后低估
+        covered = flash_stats.coverage(now_minute, minutes)
+        
+        def rate(count: int) -> float:
+            return round(count / covered, 3) if covered else 0.0
+        
+        total = flash_stats.all.total(now_minute, minutes)
+        by_importance = {}
+        for level, ring in flash_stats.importance.items():
+            count = ring.total(now_minute, minutes)
+            by_importance[level] = {'count': count, 'rate_per_minute': rate(count)}
+        by_category = []
+        for cid, ring in flash_stats.channels.items():
+            count = ring.total(now_minute, minutes)
+            if count:
+                by_category.append({
+                    'id': cid,
+                    'name': find_category_name(cid),
+                    'count': count,
+                    'rate_per_minute': rate(count),
+                })
+        by_category.sort(key=lambda x: x['count'], reverse=True)
+        windows[name] = {
+            'minutes_covered': covered,
+            'since': minute_to_iso(now_minute - covered + 1) if covered else None,
+            'count': total,
+            'rate_per_minute': rate(total),
+            'by_importance': by_importance,
+            'by_category': by_category,
+        }
+    
+    return JSONResponse({
+        "success": True,
+        "server_time": datetime.now().isoformat(),
+        "current_minute": flash_stats.all.get(now_minute),
+        "last_burst": minute_to_iso(flash_stats.last_burst_minute) if flash_stats.last_burst_minute >= 0 else None,
+        "windows": windows,
+    })
+
 @app.get("/search")
 async def search(q: str, limit: int = 20):
     """搜索快讯，VIP 快讯仅返回标题"""
@@ -600,4 +903,5 @@ async def health():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8765)
+    # log_config=None: uvicorn 日志交给 root logger，同样走队列和轮转文件
+    uvicorn.run(app, host="0.0.0.0", port=8765, log_config=None)